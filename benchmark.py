@@ -0,0 +1,73 @@
+# File: benchmark.py
+"""
+Module: Benchmark of the mcmc backends. The count matrix of the reference text is built once,
+so only the annealing loop is timed.
+Contains functions:
+    - main
+    - benchmark
+"""
+
+# imports
+import project
+import sys
+import os
+import time
+
+
+def benchmark(message, n_gram=2, runs=3, backends=project.BACKENDS):
+    """
+    Function: This function times the mcmc for each backend on the same message.
+    inputs:
+        - message: plain text to be encrypted and decrypted.
+        - n_gram: n_gram used for the score.
+        - runs: number of times each backend is run.
+        - backends: backends to compare.
+    outputs:
+        - results: dictionary of average time and accuracy for each backend.
+    """
+    countMatrix = project.count_matrix(file='wp.txt', n_gram=n_gram)
+    results = dict()
+    for backend in backends:
+        if backend == 'numba' and project.njit is not None:
+            # compile once outside of the timing
+            project.mcmc(project.encrypt(message), message, n_gram=n_gram, backend=backend, countMatrix=countMatrix)
+        total_time = 0
+        sum_of_accuracy = 0
+        for i in range(runs):
+            cipher_text = project.encrypt(message)
+            start_time = time.time()
+            info = project.mcmc(cipher_text, message, n_gram=n_gram, backend=backend, countMatrix=countMatrix)
+            total_time += time.time() - start_time
+            sum_of_accuracy += info['best']['accuracy']
+        results[backend] = {
+            'average_time': total_time / runs,
+            'average_accuracy': sum_of_accuracy / runs
+        }
+    return results
+
+
+def main(argv=None):
+    """
+    Main function.
+    Usage: python benchmark.py <n_gram> <plain_text_file> (optional:<runs>)
+    """
+    if argv is None:
+        argv = sys.argv
+    if len(argv) != 3 and len(argv) != 4:
+        print("Usage: python benchmark.py <n_gram> <plain_text_file> (optional:<runs>)")
+        sys.exit(1)
+    n_gram = int(argv[1])
+    runs = int(argv[3]) if len(argv) == 4 else 3
+    with open(os.path.join('test_files', argv[2]), 'r', encoding='utf8') as f:
+        message = f.read().strip().lower()
+
+    results = benchmark(message, n_gram=n_gram, runs=runs)
+    python_time = results['python']['average_time']
+    print('backend, average time (sec), speedup, average accuracy')
+    for backend, result in results.items():
+        print(f'{backend}, {result["average_time"]:.3f}, {python_time / result["average_time"]:.1f}, {result["average_accuracy"]:.2f}')
+
+
+###### testing and running ########
+if __name__ == '__main__':
+    main()
@@ -17,21 +17,22 @@ import os
 import time
 
 
-def main(argv, runs=100):
+def main(argv, runs=100, backend='python'):
     """
     Main function.
     """
-    data = multiple_run(argv, runs)
+    data = multiple_run(argv, runs, backend=backend)
     # save the data
     with open(os.path.join('output_files', argv[3]), 'a') as f:
         f.write('\n')
         f.write(f'{data["message"]},{data["length"]},{data["n_gram"]},{data["average_time"]},{data["average_accuracy"]},{data["num_success"]},{data["runs"]}')
 
-def multiple_run(argv, runs):
+def multiple_run(argv, runs, backend='python'):
     """
     Function: This function runs the main function of project.py several times to get statistics.
     inputs:
         - runs: number of times the algorithm is run.
+        - backend: backend of the mcmc, one of project.BACKENDS.
     outputs:
         - None
     """
@@ -44,7 +45,7 @@ def multiple_run(argv, runs):
 
     for i in range(runs):
         print(f'run {i}')
-        info, time_taken = project.main(argv, multiple=True)
+        info, time_taken = project.main(argv, multiple=True, backend=backend)
         total_time += time_taken
         # check the accuracy for this run
         if info['best']['accuracy'] == 1:
@@ -70,7 +71,8 @@ def multiple_run(argv, runs):
         'length': length,
         'n_gram': n_gram,
         'num_success': num_success,
-        'runs': runs
+        'runs': runs,
+        'backend': backend
     }
 
     # return the data
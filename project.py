@@ -14,6 +14,12 @@ Contains functions:
     - chunker
     - get_score
     - decrypt
+    - get_new_key
+    - mcmc_arrays
+    - ngram_arrays
+    - log_table
+    - n_iterations
+    - accuracy
 """
 
 # Importing external libraries
@@ -24,27 +30,55 @@ import time
 import sys
 import matplotlib.pyplot as plt
 import os
+import warnings
 import collections as c
 
+# numba is optional, the array backend falls back to numpy without it
+try:
+    from numba import njit
+    from numba.extending import overload
+except ImportError:
+    njit = None
+
 # import my own module
 import cipher
 
 # some constants
 LETTERS = string.ascii_lowercase + ' '
+N_LETTERS = len(LETTERS)
+BACKENDS = ('python', 'numpy', 'numba')
+USAGE = "Usage: python project.py <n_gram> <plain_text_file> <output_file> (optional:<key>) (optional:--backend=<python|numpy|numba>)"
+
+# annealing schedule
+TMAX = 1000
+TMIN = 1
+TAU = 1e-4
+# iterations between two snapshots in info
+SNAPSHOT = 5000
 
 
-def main(argv=None, multiple=False):
+def main(argv=None, multiple=False, backend='python'):
     """
     Main function.
     Gets the input from the user and calls the required functions.
     The final output are written to a file.
+    The backend can be given as keyword or as --backend=<name> in argv.
     """
     if argv is None:
         argv = sys.argv
-    
+
+    # pick the backend flag out of the arguments
+    options = [arg for arg in argv if arg.startswith('--backend=')]
+    argv = [arg for arg in argv if not arg.startswith('--backend=')]
+    if options:
+        backend = options[-1].split('=', 1)[1]
+    if backend not in BACKENDS:
+        print(USAGE)
+        sys.exit(1)
+
     # check the number of arguments
     if len(argv) != 4 and len(argv) != 5:
-        print("Usage: python project.py <n_gram> <plain_text_file> <output_file> (optional:<key>)")
+        print(USAGE)
         sys.exit(1)
     try:
         n_gram = int(argv[1])
@@ -69,7 +103,7 @@ def main(argv=None, multiple=False):
         else:
             key = None
     except ValueError:
-        print("Usage: python project.py <n_gram> <plain_text_file> <output_file> (optional:<key>)")
+        print(USAGE)
         sys.exit(1)
 
     # Get input from the user
@@ -86,7 +120,7 @@ def main(argv=None, multiple=False):
 
     # Load the text file and return a count matrix
     print('Please wait while we process your request...')
-    info = mcmc(cipher_text, message, n_gram=n_gram)
+    info = mcmc(cipher_text, message, n_gram=n_gram, backend=backend)
 
     # Get the end time
     end_time = time.time()
@@ -269,26 +303,37 @@ def get_new_key(key):
     return new_key
 
 
-def mcmc(cipher_text, message, n_gram=2):
+def mcmc(cipher_text, message, n_gram=2, backend='python', countMatrix=None, table=None):
     """
     Function: Given a cipher_text and prob_matrix, it tries to decrypt the message.
     Input:
         cipher_text -- cipher text to be decrypted
         prob_matrix -- prob_matrix computed based on the count_matrix for the given text
+        backend -- 'python' for the string loop, 'numpy' or 'numba' for the array loop
+        countMatrix -- count matrix of the reference text, computed from wp.txt if not given
+        table -- log_table of the count matrix for the array backends, computed if not given
     
     Output:
         plain_text -- decrypted plain text
     """
+    if backend not in BACKENDS:
+        raise ValueError('Unknown backend: {}'.format(backend))
+
     # get the count matrix for reference text
-    print("Getting the count matrix for reference text...")
-    countMatrix = count_matrix(file='wp.txt', n_gram=n_gram)
-    print("Count matrix for reference text is ready.")
+    if countMatrix is None and (backend == 'python' or table is None):
+        print("Getting the count matrix for reference text...")
+        countMatrix = count_matrix(file='wp.txt', n_gram=n_gram)
+        print("Count matrix for reference text is ready.")
+
+    if backend != 'python':
+        return mcmc_arrays(cipher_text, message, countMatrix, n_gram=n_gram, backend=backend, table=table)
+
     # regulating temperature
-    Tmax = 1000
+    Tmax = TMAX
     T = Tmax
-    Tmin = 1
+    Tmin = TMIN
     # regulating cooling rate
-    tau = 1e-4
+    tau = TAU
 
     # counting number of iterations
     count = 0
@@ -348,7 +393,7 @@ def mcmc(cipher_text, message, n_gram=2):
                 plain_text = new_plain_text
                 score = new_score
         
-        if count % 5000 == 0:
+        if count % SNAPSHOT == 0:
             info[count] = {
                 'iteration': count, 
                 'key': key, 
@@ -369,6 +414,205 @@ def mcmc(cipher_text, message, n_gram=2):
     return info
 
 
+def ngram_arrays(cipher_text, n_gram=2):
+    """
+    Function:
+        To turn the cipher text into arrays of distinct n_grams and their weights.
+        A key only relabels letters, so the n_gram counts of the cipher text are
+        the counts of the plain text and can be computed once.
+    Input:
+        cipher_text -- Cipher text
+        n_gram -- n_gram
+    Output:
+        codes -- Array of shape (number of n_grams, n_gram) with letter indices, space is 26
+        weights -- Weight (1 + count) of each n_gram, as used by get_score
+    """
+    currentMatrix = count_matrix(text=cipher_text, n_gram=n_gram)
+    grams = list(currentMatrix.keys())
+    codes = np.array([[LETTERS.index(letter) for letter in gram] for gram in grams], dtype=np.int64)
+    codes = codes.reshape(len(grams), n_gram)
+    weights = np.array([1 + currentMatrix[gram] for gram in grams], dtype=np.float64)
+    return codes, weights
+
+
+def log_table(countMatrix, n_gram=2):
+    """
+    Function:
+        To turn the count matrix of the reference text into a flat table of log(1 + count).
+        The n_gram with letter indices (i, j, ...) is stored at i * N_LETTERS**(n_gram-1) + j * N_LETTERS**(n_gram-2) + ...
+    Input:
+        countMatrix -- Count matrix of the reference text
+        n_gram -- n_gram
+    Output:
+        table -- Table of log(1 + count)
+    """
+    table = np.zeros(N_LETTERS ** n_gram, dtype=np.float64)
+    for gram, count in countMatrix.items():
+        # n_grams with letters outside LETTERS can never be scored
+        if all(letter in LETTERS for letter in gram):
+            index = 0
+            for letter in gram:
+                index = index * N_LETTERS + LETTERS.index(letter)
+            table[index] = np.log(1 + count)
+    return table
+
+
+def _score_loop(codes, weights, table, decoder):
+    """Score of the decoder as a plain loop, compiled by numba."""
+    score = 0.0
+    for i in range(codes.shape[0]):
+        index = 0
+        for j in range(codes.shape[1]):
+            index = index * N_LETTERS + decoder[codes[i, j]]
+        score += weights[i] * table[index]
+    return score
+
+
+def _score_numpy(codes, weights, table, decoder):
+    """Score of the decoder with numpy indexing."""
+    powers = N_LETTERS ** np.arange(codes.shape[1] - 1, -1, -1)
+    return np.dot(weights, table[np.dot(decoder[codes], powers)])
+
+
+if njit is not None:
+    @overload(_score_numpy)
+    def _score_numpy_compiled(codes, weights, table, decoder):
+        """In compiled code, _score_numpy is the loop of _score_loop."""
+        return _score_loop
+
+
+def _anneal(codes, weights, table, key, n_iter, rng):
+    """
+    Annealing loop over integer arrays.
+    key[j] is the cipher letter that decrypts to letter j, like the string keys.
+    rng is a numpy Generator, so the global random state is left alone.
+    Runs as it is with numpy, and compiled by numba with _score_loop in place of _score_numpy.
+    Returns the snapshot iterations, keys and scores, and the best key and score.
+    """
+    key = key.copy()
+    # decoder[c] is the plain letter of the cipher letter c, space stays space
+    decoder = np.empty(N_LETTERS, dtype=np.int64)
+    for j in range(26):
+        decoder[key[j]] = j
+    decoder[N_LETTERS - 1] = N_LETTERS - 1
+
+    n_snapshots = n_iter // SNAPSHOT + 2
+    snap_iterations = np.zeros(n_snapshots, dtype=np.int64)
+    snap_keys = np.zeros((n_snapshots, 26), dtype=np.int64)
+    snap_scores = np.zeros(n_snapshots, dtype=np.float64)
+
+    score = _score_numpy(codes, weights, table, decoder)
+    snap_keys[0] = key
+    snap_scores[0] = score
+    snap = 1
+    best_key = key.copy()
+    best_score = score
+
+    for count in range(1, n_iter + 1):
+        T = TMAX * np.exp(-TAU * count)
+        # random swap
+        index1 = rng.integers(0, 26)
+        index2 = rng.integers(0, 26)
+        key[index1], key[index2] = key[index2], key[index1]
+        decoder[key[index1]] = index1
+        decoder[key[index2]] = index2
+
+        new_score = _score_numpy(codes, weights, table, decoder)
+        diff = new_score - score
+        if diff >= 0 or rng.random() < np.exp(diff / T):
+            score = new_score
+            if diff >= 0 and score > best_score:
+                best_key[:] = key
+                best_score = score
+        else:
+            # undo the swap
+            key[index1], key[index2] = key[index2], key[index1]
+            decoder[key[index1]] = index1
+            decoder[key[index2]] = index2
+
+        if count % SNAPSHOT == 0 or count == n_iter:
+            snap_iterations[snap] = count
+            snap_keys[snap] = key
+            snap_scores[snap] = score
+            snap += 1
+
+    return snap_iterations[:snap], snap_keys[:snap], snap_scores[:snap], best_key, best_score
+
+
+_anneal_numpy = _anneal
+# cached on disk, so new processes do not compile it again
+_anneal_numba = njit(cache=True)(_anneal) if njit is not None else None
+
+
+def n_iterations():
+    """
+    Function:
+        To get the number of iterations of the annealing schedule.
+    Output:
+        count -- First iteration where the temperature is not above TMIN
+    """
+    count = int(np.ceil(np.log(TMAX / TMIN) / TAU))
+    # guard against rounding on either side
+    while TMAX * np.exp(-TAU * count) > TMIN:
+        count += 1
+    while count > 1 and TMAX * np.exp(-TAU * (count - 1)) <= TMIN:
+        count -= 1
+    return count
+
+
+def mcmc_arrays(cipher_text, message, countMatrix, n_gram=2, backend='numba', table=None):
+    """
+    Function: Same as mcmc, but the annealing loop runs over integer arrays.
+    With backend 'numba' the loop is compiled if numba is installed, otherwise it runs with numpy.
+    Input:
+        cipher_text -- cipher text to be decrypted
+        message -- original message, for the accuracy
+        countMatrix -- count matrix of the reference text, not used if table is given
+        n_gram -- n_gram
+        backend -- 'numpy' or 'numba'
+        table -- log_table of the count matrix, so it can be built once for many runs
+    Output:
+        info -- same structure as returned by mcmc
+    """
+    if backend == 'numba' and _anneal_numba is not None:
+        anneal = _anneal_numba
+    else:
+        if backend == 'numba':
+            # the default filter shows this once, not on every run
+            warnings.warn("numba is not installed, using the numpy backend.")
+        anneal = _anneal_numpy
+
+    codes, weights = ngram_arrays(cipher_text, n_gram=n_gram)
+    if table is None:
+        table = log_table(countMatrix, n_gram=n_gram)
+    key = np.array([ord(letter) - ord('A') for letter in random_key()], dtype=np.int64)
+
+    iterations, keys, scores, best_key, best_score = anneal(
+        codes, weights, table, key, n_iterations(), np.random.default_rng(random.randrange(2**32)))
+
+    info = dict()
+    for count, key, score in zip(iterations, keys, scores):
+        key = ''.join(chr(ord('A') + letter) for letter in key)
+        plain_text = decrypt(cipher_text, key)
+        info[int(count)] = {
+            'iteration': int(count),
+            'key': key,
+            'score': float(score),
+            'plain_text': plain_text,
+            'accuracy': accuracy(plain_text, message)}
+
+    best_key = ''.join(chr(ord('A') + letter) for letter in best_key)
+    plain_text = decrypt(cipher_text, best_key)
+    info['best'] = {
+        'key': best_key,
+        'plain_text': plain_text,
+        'score': float(best_score),
+        'accuracy': accuracy(plain_text, message)
+    }
+
+    return info
+
+
 def plot_score(info, file_name,n_gram=2):
     """
     Function: To plot the score list.
@@ -0,0 +1,484 @@
+# File: server.py
+"""
+Module: Long-lived job server for decrypting cipher texts with the mcmc of project.py.
+The n_gram count matrices and log tables of the reference text are built once at startup, and the jobs
+run on a fixed number of worker processes, so a job pays neither process startup nor model building.
+
+The server listens on a Unix socket. Every request is one line of JSON and gets one line of JSON back:
+    {"op": "decrypt", "id": "job1", "cipher_text": "...", "n_gram": 3, "backend": "numba", "timeout": 60}
+    {"op": "cancel", "id": "job1"}
+    {"op": "stats"}
+"message" can be added to a decrypt request to get the accuracy of the result; it is null if the lengths differ.
+When all workers are busy, jobs wait in a queue of fixed size; once the queue is full, jobs are rejected.
+A running job that is cancelled or times out is stopped by restarting its worker process;
+the new process loads the compiled numba loop from the cache of project.py.
+
+Contains functions and classes:
+    - main
+    - load_models
+    - request
+    - Worker
+    - JobServer
+"""
+
+# imports
+import project
+import asyncio
+import collections as c
+import itertools
+import json
+import multiprocessing
+import numpy as np
+import os
+import signal
+import sys
+import time
+
+
+class WorkerRestarted(Exception):
+    """Raised for the job of a worker that was restarted before it finished."""
+
+
+def load_models(n_grams=(1, 2, 3, 4, 5), file='wp.txt'):
+    """
+    Function: To build the count matrix of the reference text, and its log table for the array backends, for each n_gram.
+    The worker processes are forked with the models, so they share the tables instead of building their own.
+    Input:
+        n_grams -- n_grams to build
+        file -- reference text
+    Output:
+        models -- dictionary of n_gram to (count matrix, log table)
+    """
+    models = dict()
+    for n_gram in n_grams:
+        countMatrix = project.count_matrix(file=file, n_gram=n_gram)
+        models[n_gram] = (countMatrix, project.log_table(countMatrix, n_gram=n_gram))
+    return models
+
+
+def _worker_main(conn, models):
+    """
+    Function: Loop of a worker process. Receives a job from the pipe, runs the mcmc and sends back the result.
+    Input:
+        conn -- end of the pipe of the worker
+        models -- dictionary of n_gram to (count matrix, log table)
+    """
+    # Ctrl-C is handled by the server, which stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # compile the numba loop before the first job
+    if project.njit is not None:
+        n_gram = min(models)
+        countMatrix, table = models[n_gram]
+        project.mcmc('warm up', 'warm up', n_gram=n_gram, backend='numba', countMatrix=countMatrix, table=table)
+
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        try:
+            n_gram = job['n_gram']
+            countMatrix, table = models[n_gram]
+            # accuracy compares letter by letter, so it needs a message of the same length
+            message = job.get('message')
+            comparable = message is not None and len(message) == len(job['cipher_text'])
+            info = project.mcmc(job['cipher_text'], message if comparable else job['cipher_text'],
+                                n_gram=n_gram, backend=job['backend'], countMatrix=countMatrix, table=table)
+            result = {
+                'ok': True,
+                'key': info['best']['key'],
+                'plain_text': info['best']['plain_text'],
+                'score': info['best']['score'],
+            }
+            if message is not None:
+                result['accuracy'] = info['best']['accuracy'] if comparable else None
+        except Exception as e:
+            result = {'ok': False, 'error': '{}: {}'.format(type(e).__name__, e)}
+        conn.send(result)
+
+
+class Worker:
+    """A worker process with a pipe to it. Only one job runs on a worker at a time."""
+
+    def __init__(self, models):
+        """Starts the worker process."""
+        self._models = models
+        self._waiter = None
+        self._restarting = None
+        self._start()
+
+    def _start(self):
+        """Starts a new process and pipe."""
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_worker_main, args=(child_conn, self._models), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def _on_readable(self):
+        """Hands the result from the pipe to the waiting job."""
+        if self._waiter is None or self._waiter.done():
+            return
+        try:
+            self._waiter.set_result(self.conn.recv())
+        except EOFError:
+            self._waiter.set_exception(WorkerRestarted('worker process died'))
+
+    async def run(self, job):
+        """Runs the job on the worker process and returns its result."""
+        if self._restarting is not None:
+            await self._restarting
+        loop = asyncio.get_running_loop()
+        self._waiter = loop.create_future()
+        fd = self.conn.fileno()
+        try:
+            self.conn.send(job)
+        except OSError as e:
+            # the process died while it was idle
+            self._waiter = None
+            raise WorkerRestarted('worker process died') from e
+        loop.add_reader(fd, self._on_readable)
+        try:
+            return await self._waiter
+        finally:
+            loop.remove_reader(fd)
+            self._waiter = None
+
+    def restart(self):
+        """
+        Stops the running job now, then kills the process and starts a fresh one without blocking the loop.
+        Returns the task of the restart; the next run waits for it.
+        """
+        if self._waiter is not None:
+            asyncio.get_running_loop().remove_reader(self.conn.fileno())
+            if not self._waiter.done():
+                self._waiter.set_exception(WorkerRestarted('worker was restarted'))
+        if self._restarting is None or self._restarting.done():
+            self._restarting = asyncio.get_running_loop().create_task(self._replace())
+        return self._restarting
+
+    async def _replace(self):
+        """Kills the process and starts a fresh one."""
+        await self.stop()
+        self._start()
+
+    async def stop(self):
+        """Kills the process and waits for it to exit without blocking the loop."""
+        loop = asyncio.get_running_loop()
+        exited = loop.create_future()
+        sentinel = self.process.sentinel
+        # the sentinel becomes readable once the process has exited
+        loop.add_reader(sentinel, lambda: exited.done() or exited.set_result(None))
+        try:
+            self.process.terminate()
+            await exited
+        finally:
+            loop.remove_reader(sentinel)
+        self.process.join()
+        self.conn.close()
+
+    async def close(self):
+        """Waits for a pending restart and stops the process."""
+        if self._restarting is not None:
+            await asyncio.gather(self._restarting, return_exceptions=True)
+        await self.stop()
+
+
+class JobServer:
+    """
+    Runs decrypt jobs on a bounded pool of worker processes.
+    At most `workers` jobs run at once and at most `max_queue` jobs wait; further jobs are rejected.
+    """
+
+    def __init__(self, models, workers=None, max_queue=None, latency_window=1000):
+        """
+        Input:
+            models -- dictionary of n_gram to (count matrix, log table), as built by load_models
+            workers -- number of worker processes, the number of CPUs by default
+            max_queue -- number of jobs that can wait for a worker, same as workers by default
+            latency_window -- number of finished jobs kept for the latency percentiles
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers < 1:
+            raise ValueError('workers must be at least 1')
+        if max_queue is None:
+            max_queue = workers
+        if max_queue < 0:
+            raise ValueError('max_queue must not be negative')
+        self.models = models
+        self.n_workers = workers
+        self.max_queue = max_queue
+        self.jobs = dict()
+        self.latencies = c.deque(maxlen=latency_window)
+        self.counts = c.Counter()
+        self._ids = itertools.count()
+        self._queue = None
+        self._workers = []
+        self._tasks = []
+
+    async def start(self):
+        """Starts the worker processes and the tasks that feed them."""
+        self._queue = asyncio.Queue()
+        self._workers = [Worker(self.models) for i in range(self.n_workers)]
+        self._tasks = [asyncio.create_task(self._dispatch(worker)) for worker in self._workers]
+
+    async def stop(self):
+        """Stops the worker processes and answers the unfinished jobs."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for worker in self._workers:
+            await worker.close()
+        for job in self.jobs.values():
+            if not job['future'].done():
+                job['future'].set_result({'ok': False, 'id': job['id'], 'error': 'shutdown'})
+        self.jobs.clear()
+
+    def queue_depth(self):
+        """Number of jobs waiting for a worker."""
+        return sum(1 for job in self.jobs.values() if job['state'] == 'queued')
+
+    def submit(self, request):
+        """
+        Function: To put a decrypt job in the queue.
+        Input:
+            request -- decrypt request
+        Output:
+            job -- the job, its 'future' gives the response
+        """
+        if 'id' in request:
+            job_id = str(request['id'])
+        else:
+            job_id = 'job-{}'.format(next(self._ids))
+        if job_id in self.jobs:
+            raise ValueError('Job {} already exists'.format(job_id))
+        n_gram = int(request.get('n_gram', 3))
+        if n_gram not in self.models:
+            raise ValueError('n_gram {} is not loaded'.format(n_gram))
+        backend = request.get('backend', 'numba')
+        if backend not in project.BACKENDS:
+            raise ValueError('Unknown backend: {}'.format(backend))
+        timeout = request.get('timeout')
+        if timeout is not None and (isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or timeout <= 0):
+            raise ValueError('timeout must be a positive number of seconds')
+        cipher_text = str(request['cipher_text']).lower()
+        message = request.get('message')
+
+        # jobs in self.jobs are either running or queued
+        if len(self.jobs) >= self.n_workers + self.max_queue:
+            self.counts['rejected'] += 1
+            future = asyncio.get_running_loop().create_future()
+            future.set_result({'ok': False, 'id': job_id, 'error': 'busy'})
+            return {'id': job_id, 'future': future}
+
+        job = {
+            'id': job_id,
+            'state': 'queued',
+            'submitted': time.monotonic(),
+            'timeout': timeout,
+            'worker': None,
+            'future': asyncio.get_running_loop().create_future(),
+            'request': {
+                'cipher_text': cipher_text,
+                'message': message.lower() if message else None,
+                'n_gram': n_gram,
+                'backend': backend,
+            },
+        }
+        self.jobs[job_id] = job
+        self._queue.put_nowait(job)
+        return job
+
+    def cancel(self, job_id, reason='cancelled'):
+        """
+        Function: To cancel a job. A queued job is dropped, a running job stops its worker.
+        Input:
+            job_id -- id of the job
+            reason -- error reported for the job
+        Output:
+            True if the job was found
+        """
+        job = self.jobs.pop(str(job_id), None)
+        if job is None:
+            return False
+        self.counts[reason] += 1
+        job['future'].set_result({'ok': False, 'id': job['id'], 'error': reason})
+        if job['state'] == 'running':
+            job['worker'].restart()
+        job['state'] = reason
+        return True
+
+    async def run(self, request):
+        """
+        Function: To submit a decrypt job and wait for its response.
+        A job that is not done within request['timeout'] seconds is cancelled.
+        """
+        job = self.submit(request)
+        try:
+            return await asyncio.wait_for(asyncio.shield(job['future']), job.get('timeout'))
+        except asyncio.TimeoutError:
+            self.cancel(job['id'], reason='timeout')
+            return job['future'].result()
+
+    async def _dispatch(self, worker):
+        """Takes jobs from the queue and runs them on the worker, one at a time."""
+        while True:
+            job = await self._queue.get()
+            # cancelled while in the queue
+            if job['future'].done():
+                continue
+            job['state'] = 'running'
+            job['worker'] = worker
+            try:
+                result = await worker.run(job['request'])
+            except Exception as e:
+                # a cancelled job has been answered and its worker restarted already
+                if not job['future'].done():
+                    error = str(e) if isinstance(e, WorkerRestarted) else '{}: {}'.format(type(e).__name__, e)
+                    self.jobs.pop(job['id'], None)
+                    self.counts['failed'] += 1
+                    job['future'].set_result({'ok': False, 'id': job['id'], 'error': error})
+                    worker.restart()
+                continue
+            # cancelled or timed out after the worker handed over its result
+            if job['future'].done():
+                continue
+            self.jobs.pop(job['id'], None)
+            latency = time.monotonic() - job['submitted']
+            self.latencies.append(latency)
+            self.counts['done' if result['ok'] else 'failed'] += 1
+            result['id'] = job['id']
+            result['latency'] = latency
+            job['future'].set_result(result)
+
+    def stats(self):
+        """
+        Function: To get the state of the server.
+        Output:
+            stats -- workers, queue depth, running jobs, job counts and latency percentiles in seconds
+        """
+        stats = {
+            'workers': self.n_workers,
+            'max_queue': self.max_queue,
+            'queue_depth': self.queue_depth(),
+            'running': sum(1 for job in self.jobs.values() if job['state'] == 'running'),
+            'counts': dict(self.counts),
+        }
+        for percentile in (50, 90, 99):
+            stats['p{}'.format(percentile)] = float(np.percentile(self.latencies, percentile)) if self.latencies else None
+        return stats
+
+    async def handle(self, request):
+        """Answers one request."""
+        if not isinstance(request, dict):
+            raise ValueError('Request must be a JSON object')
+        op = request.get('op')
+        if op == 'decrypt':
+            return await self.run(request)
+        elif op == 'cancel':
+            return {'ok': self.cancel(request.get('id')), 'id': request.get('id')}
+        elif op == 'stats':
+            return dict(ok=True, **self.stats())
+        raise ValueError('Unknown op: {}'.format(op))
+
+    async def _answer(self, line, writer, lock):
+        """Answers one line of a connection."""
+        request = None
+        try:
+            request = json.loads(line)
+            response = await self.handle(request)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            response = {'ok': False, 'error': '{}: {}'.format(type(e).__name__, e)}
+            if isinstance(request, dict) and 'id' in request:
+                response['id'] = request['id']
+        async with lock:
+            writer.write((json.dumps(response) + '\n').encode('utf8'))
+            await writer.drain()
+
+    async def connection(self, reader, writer):
+        """
+        Serves one connection. The requests of a connection are answered as they finish,
+        so a cancel is not stuck behind the decrypt it cancels.
+        """
+        lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                task = asyncio.create_task(self._answer(line, writer, lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            writer.close()
+
+    async def serve(self, path):
+        """Serves requests on the Unix socket at path until cancelled."""
+        await self.start()
+        server = await asyncio.start_unix_server(self.connection, path=path)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.stop()
+            if os.path.exists(path):
+                os.remove(path)
+
+
+async def request(path, payload):
+    """
+    Function: To send one request to the server and wait for its response.
+    Input:
+        path -- path of the Unix socket
+        payload -- request as a dictionary
+    Output:
+        response -- response as a dictionary
+    """
+    reader, writer = await asyncio.open_unix_connection(path)
+    try:
+        writer.write((json.dumps(payload) + '\n').encode('utf8'))
+        await writer.drain()
+        return json.loads(await reader.readline())
+    finally:
+        writer.close()
+
+
+def main(argv=None):
+    """
+    Main function.
+    Usage: python server.py <socket_path> (optional:<workers>) (optional:<max_queue>)
+    """
+    if argv is None:
+        argv = sys.argv
+    if not 2 <= len(argv) <= 4:
+        print("Usage: python server.py <socket_path> (optional:<workers>) (optional:<max_queue>)")
+        sys.exit(1)
+    try:
+        workers = int(argv[2]) if len(argv) > 2 else None
+        max_queue = int(argv[3]) if len(argv) > 3 else None
+        if workers is not None and workers < 1:
+            raise ValueError
+        if max_queue is not None and max_queue < 0:
+            raise ValueError
+    except ValueError:
+        print("Usage: python server.py <socket_path> (optional:<workers>) (optional:<max_queue>)")
+        sys.exit(1)
+
+    print('Building the count matrices and log tables for reference text...')
+    models = load_models()
+    server = JobServer(models, workers=workers, max_queue=max_queue)
+    print('Serving on {} with {} workers.'.format(argv[1], server.n_workers))
+    try:
+        asyncio.run(server.serve(argv[1]))
+    except KeyboardInterrupt:
+        pass
+
+
+###### testing and running ########
+if __name__ == '__main__':
+    main()
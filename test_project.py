@@ -10,6 +10,7 @@ import pytest
 import project
 import cipher
 import string
+import os
 import numpy as np
     
 def test_chunker():
@@ -67,3 +68,96 @@ def test_accuracy():
     assert project.accuracy('hello', 'hillo') == 0.8
     assert project.accuracy('hello', 'hillo world') == 0.8
     assert project.accuracy('the world is beautiful', 'the world is beautiful') == 1
+
+
+def test_log_table():
+    """
+    Test for log_table function.
+    """
+    table = project.log_table({'ab': 2, ' a': 1, 'é ': 5}, n_gram=2)
+    assert len(table) == 27 ** 2
+    assert table[0 * 27 + 1] == np.log(3)
+    assert table[26 * 27 + 0] == np.log(2)
+    assert np.count_nonzero(table) == 2
+
+
+def test_ngram_arrays():
+    """
+    Test for ngram_arrays function.
+    """
+    codes, weights = project.ngram_arrays('hello, hello', n_gram=2)
+    grams = [''.join(project.LETTERS[i] for i in code) for code in codes]
+    assert dict(zip(grams, weights)) == {'he': 3, 'el': 3, 'll': 3, 'lo': 3, 'o ': 2, ' h': 2}
+
+
+def test_array_score():
+    """
+    The score of the array backends should match get_score.
+    """
+    countMatrix = project.count_matrix(text='the quick brown fox jumps over the lazy dog', n_gram=2)
+    cipher_text = project.encrypt('hello there fox')
+    key = project.random_key()
+    codes, weights = project.ngram_arrays(cipher_text, n_gram=2)
+    table = project.log_table(countMatrix, n_gram=2)
+    decoder = np.empty(27, dtype=np.int64)
+    decoder[[ord(letter) - ord('A') for letter in key]] = np.arange(26)
+    decoder[26] = 26
+    expected = project.get_score(project.decrypt(cipher_text, key), countMatrix, n_gram=2)
+    assert project._score_numpy(codes, weights, table, decoder) == pytest.approx(expected)
+    assert project._score_loop(codes, weights, table, decoder) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize('backend', ['numpy', 'numba'])
+def test_mcmc_arrays(backend):
+    """
+    Test for mcmc_arrays function.
+    """
+    if backend == 'numba':
+        pytest.importorskip('numba')
+    message = 'the answer to life the universe and everything is forty two'
+    countMatrix = project.count_matrix(text=message, n_gram=2)
+    info = project.mcmc_arrays(project.encrypt(message), message, countMatrix, n_gram=2, backend=backend)
+    # a prebuilt table replaces the count matrix
+    table = project.log_table(countMatrix, n_gram=2)
+    assert 'best' in project.mcmc(project.encrypt(message), message, n_gram=2, backend=backend, table=table)
+    n_iter = project.n_iterations()
+    assert list(info.keys())[0] == 0
+    assert list(info.keys())[-2:] == [n_iter, 'best']
+    assert set(info['best'].keys()) == {'key', 'plain_text', 'score', 'accuracy'}
+    assert ''.join(sorted(info['best']['key'])) == string.ascii_uppercase
+    assert info['best']['score'] >= max(info[i]['score'] for i in info if i != 'best')
+
+
+def test_mcmc_backend():
+    """
+    mcmc should reject an unknown backend.
+    """
+    with pytest.raises(ValueError):
+        project.mcmc('abc', 'abc', backend='fortran')
+
+
+def test_main_backend(monkeypatch):
+    """
+    main should take the backend out of argv and reject an unknown one.
+    """
+    monkeypatch.chdir(os.path.dirname(os.path.abspath(__file__)))
+    calls = []
+    monkeypatch.setattr(project, 'mcmc', lambda *args, **kwargs: calls.append(kwargs) or {})
+    project.main(['project.py', '2', 'test2.txt', 'out.txt', '--backend=numpy'], multiple=True)
+    assert calls[-1]['backend'] == 'numpy'
+    project.main(['project.py', '2', 'test2.txt', 'out.txt', '1', '--backend=numba'], multiple=True)
+    assert calls[-1]['backend'] == 'numba'
+    with pytest.raises(SystemExit):
+        project.main(['project.py', '2', 'test2.txt', 'out.txt', '--backend=fortran'], multiple=True)
+
+
+def test_numba_fallback(monkeypatch):
+    """
+    Without numba, the numba backend should warn and run with numpy.
+    """
+    monkeypatch.setattr(project, '_anneal_numba', None)
+    message = 'hello world'
+    countMatrix = project.count_matrix(text=message, n_gram=1)
+    with pytest.warns(UserWarning):
+        info = project.mcmc_arrays(project.encrypt(message), message, countMatrix, n_gram=1, backend='numba')
+    assert 'best' in info
@@ -0,0 +1,205 @@
+# File: test_server.py
+
+"""
+Module: Test for server.py
+Contains functions:
+    - test_load_models
+    - test_run
+    - test_busy_and_cancel
+    - test_cancel_after_result
+    - test_worker_died
+    - test_answer_error_id
+    - test_bad_request
+    - test_main_arguments
+"""
+# imports
+import asyncio
+import json
+import os
+import pytest
+import project
+import server
+
+MESSAGE = 'the answer to life the universe and everything is forty two'
+
+
+def models():
+    """Small count matrices and their log tables, so the tests do not read wp.txt."""
+    models = dict()
+    for n_gram in (1, 2):
+        countMatrix = project.count_matrix(text=MESSAGE, n_gram=n_gram)
+        models[n_gram] = (countMatrix, project.log_table(countMatrix, n_gram=n_gram))
+    return models
+
+
+def run(coroutine_function):
+    """Runs the coroutine function with a started server of one worker and a queue of one."""
+    async def wrapper():
+        job_server = server.JobServer(models(), workers=1, max_queue=1)
+        await job_server.start()
+        try:
+            return await coroutine_function(job_server)
+        finally:
+            await job_server.stop()
+    return asyncio.run(wrapper())
+
+
+def test_load_models():
+    """
+    load_models should give the count matrix and its log table for each n_gram.
+    """
+    file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'wp.txt')
+    models = server.load_models(n_grams=(1,), file=file)
+    countMatrix, table = models[1]
+    assert list(models) == [1]
+    assert countMatrix == project.count_matrix(file=file, n_gram=1)
+    assert (table == project.log_table(countMatrix, n_gram=1)).all()
+
+
+def test_run():
+    """
+    A decrypt job should give the best key and be counted in the stats.
+    """
+    async def check(job_server):
+        cipher_text = project.encrypt(MESSAGE)
+        response = await job_server.handle({'op': 'decrypt', 'id': 'a', 'cipher_text': cipher_text,
+                                            'message': MESSAGE, 'n_gram': 2, 'backend': 'numpy'})
+        assert response['ok'] and response['id'] == 'a'
+        assert project.decrypt(cipher_text, response['key']) == response['plain_text']
+        assert 0 <= response['accuracy'] <= 1
+        response = await job_server.handle({'op': 'decrypt', 'id': 'b', 'cipher_text': cipher_text,
+                                            'message': MESSAGE[:10], 'n_gram': 2, 'backend': 'numpy'})
+        assert response['ok'] and response['accuracy'] is None
+        assert project.decrypt(cipher_text, response['key']) == response['plain_text']
+        stats = await job_server.handle({'op': 'stats'})
+        assert stats['counts'] == {'done': 2}
+        assert stats['queue_depth'] == 0 and stats['running'] == 0
+        assert stats['p50'] is not None
+        # automatic ids do not collide with the ids of the clients
+        job = job_server.submit({'cipher_text': cipher_text, 'n_gram': 2, 'backend': 'numpy'})
+        assert job['id'] == 'job-0'
+        assert job_server.submit({'id': '0', 'cipher_text': cipher_text, 'n_gram': 2, 'backend': 'numpy'})['id'] == '0'
+        assert job_server.submit({'cipher_text': cipher_text, 'n_gram': 2, 'backend': 'numpy'})['id'] == 'job-1'
+        for job_id in ('job-0', '0', 'job-1'):
+            job_server.cancel(job_id)
+    run(check)
+
+
+def test_busy_and_cancel():
+    """
+    With the worker and the queue taken, a job should be rejected. Cancelled jobs should be answered.
+    """
+    async def check(job_server):
+        request = {'op': 'decrypt', 'cipher_text': project.encrypt(MESSAGE), 'n_gram': 2, 'backend': 'python'}
+        running = asyncio.create_task(job_server.handle(dict(request, id='a')))
+        queued = asyncio.create_task(job_server.handle(dict(request, id='b')))
+        await asyncio.sleep(0.1)
+        assert job_server.stats()['running'] == 1 and job_server.stats()['queue_depth'] == 1
+        assert await job_server.handle(dict(request, id='c')) == {'ok': False, 'id': 'c', 'error': 'busy'}
+
+        assert (await job_server.handle({'op': 'cancel', 'id': 'b'}))['ok']
+        assert (await job_server.handle({'op': 'cancel', 'id': 'a'}))['ok']
+        assert (await job_server.handle({'op': 'cancel', 'id': 'a'}))['ok'] is False
+        assert (await queued)['error'] == 'cancelled'
+        assert (await running)['error'] == 'cancelled'
+
+        response = await job_server.handle(dict(request, id='d', timeout=0.1))
+        assert response['error'] == 'timeout'
+        assert job_server.stats()['counts'] == {'rejected': 1, 'cancelled': 2, 'timeout': 1}
+    run(check)
+
+
+def test_cancel_after_result():
+    """
+    A cancel that arrives after the worker handed over its result, but before the dispatch
+    resumes, should not stop the dispatch of the worker.
+    """
+    async def check(job_server):
+        request = {'op': 'decrypt', 'cipher_text': project.encrypt(MESSAGE), 'n_gram': 2, 'backend': 'numpy'}
+        worker = job_server._workers[0]
+
+        async def run_then_cancel(job):
+            # the result is ready, and the cancel comes before the dispatch resumes
+            del worker.run
+            result = await worker.run(job)
+            job_server.cancel('a')
+            return result
+        worker.run = run_then_cancel
+
+        response = await asyncio.wait_for(job_server.handle(dict(request, id='a')), 30)
+        assert response == {'ok': False, 'id': 'a', 'error': 'cancelled'}
+        response = await asyncio.wait_for(job_server.handle(dict(request, id='b')), 30)
+        assert response['ok']
+        assert not job_server._tasks[0].done()
+    run(check)
+
+
+def test_worker_died():
+    """
+    A job on a worker that died while idle should fail, and the worker should be replaced.
+    """
+    async def check(job_server):
+        request = {'op': 'decrypt', 'cipher_text': project.encrypt(MESSAGE), 'n_gram': 2, 'backend': 'numpy'}
+        job_server._workers[0].process.kill()
+        job_server._workers[0].process.join()
+        response = await asyncio.wait_for(job_server.handle(dict(request, id='a')), 30)
+        assert response == {'ok': False, 'id': 'a', 'error': 'worker process died'}
+        assert job_server.stats()['running'] == 0
+        response = await asyncio.wait_for(job_server.handle(dict(request, id='b')), 30)
+        assert response['ok']
+    run(check)
+
+
+def test_answer_error_id():
+    """
+    The error response to a bad request should carry the id of the request.
+    """
+    class Writer:
+        def __init__(self):
+            self.data = b''
+
+        def write(self, data):
+            self.data += data
+
+        async def drain(self):
+            pass
+
+    async def check(job_server):
+        writer = Writer()
+        line = json.dumps({'op': 'decrypt', 'id': 'a', 'cipher_text': 'abc', 'n_gram': 2, 'timeout': '5'})
+        await job_server._answer(line, writer, asyncio.Lock())
+        response = json.loads(writer.data)
+        assert response['ok'] is False and response['id'] == 'a'
+    run(check)
+
+
+def test_bad_request():
+    """
+    Bad requests should raise ValueError.
+    """
+    async def check(job_server):
+        with pytest.raises(ValueError):
+            await job_server.handle({'op': 'decrypt', 'cipher_text': 'abc', 'n_gram': 5})
+        with pytest.raises(ValueError):
+            await job_server.handle({'op': 'decrypt', 'cipher_text': 'abc', 'n_gram': 2, 'backend': 'fortran'})
+        with pytest.raises(ValueError):
+            await job_server.handle({'op': 'shutdown'})
+        with pytest.raises(ValueError):
+            server.JobServer(models(), workers=0)
+        with pytest.raises(ValueError):
+            server.JobServer(models(), workers=1, max_queue=-1)
+        for timeout in ('5', 0, -1, True):
+            with pytest.raises(ValueError):
+                await job_server.handle({'op': 'decrypt', 'cipher_text': 'abc', 'n_gram': 2, 'timeout': timeout})
+        assert job_server.jobs == {}
+    run(check)
+
+
+def test_main_arguments(capsys):
+    """
+    main should print the usage for a worker count below 1 or a negative queue size.
+    """
+    for argv in (['server.py', 'x.sock', '0'], ['server.py', 'x.sock', '2', '-1'], ['server.py', 'x.sock', 'two']):
+        with pytest.raises(SystemExit):
+            server.main(argv)
+        assert 'Usage' in capsys.readouterr().out